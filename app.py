@@ -1,7 +1,13 @@
-from flask import Flask, request, jsonify
-import os, csv, sqlite3, json, re, difflib, threading
+from quart import Quart, request, jsonify, abort
+from quart.json.provider import JSONProvider
+import os, sys, csv, sqlite3, re, functools
+import orjson
 from datetime import datetime
+from collections import defaultdict
+from cachetools import TTLCache
 import google.generativeai as genai
+from rapidfuzz import process, fuzz
+import ahocorasick
 
 # ==============================
 # ---- API / LLM CONFIG ----
@@ -10,13 +16,47 @@ GEMINI_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_KEY:
     raise RuntimeError("Uh-oh: GEMINI_API_KEY not set. Try: export GEMINI_API_KEY='...'")
 
+# Fields Gemini has to return for a chat message; university/campus/department
+# stay optional so the model can leave out what the user never mentioned.
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "university": {"type": "string"},
+        "campus": {"type": "string"},
+        "department": {"type": "string"},
+        "program": {"type": "string"},
+        "year": {"type": "integer"},
+    },
+    "required": ["program", "year"],
+}
+
 genai.configure(api_key=GEMINI_KEY)
-llm_model = genai.GenerativeModel("gemini-1.5-flash")
+# JSON mode: the reply body is exactly one EXTRACTION_SCHEMA object, no prose
+llm_model = genai.GenerativeModel(
+    "gemini-1.5-flash",
+    generation_config=genai.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=EXTRACTION_SCHEMA,
+    ),
+)
 
 # ==============================
-# ---- FLASK APP ----
+# ---- QUART APP ----
 # ==============================
-app = Flask(__name__, static_url_path="", static_folder="static")
+class OrjsonProvider(JSONProvider):
+    """Routes request.json / jsonify through orjson; responses skip the str round-trip."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+app = Quart(__name__, static_url_path="", static_folder="static")
+app.json = OrjsonProvider(app)
 
 # ==============================
 # ---- STORAGE PATHS ----
@@ -28,17 +68,59 @@ CSV_FILE = "merit_list.csv"   # put your CSV here
 # ---- IN-MEMORY CONTEXT ----
 # ==============================
 # NOTE: ephemeral only; swap with persistent store for prod
-user_context = {}
-ctx_lock = threading.Lock()
+# Idle sessions expire after 15 min so memory stays bounded. There is no lock:
+# chat() reads a session, awaits the LLM, then writes/pops it, so two requests
+# for one session can interleave (last write wins). The old lock never covered
+# that read-modify-write either; it only guarded the individual get/set calls.
+user_context = TTLCache(maxsize=50_000, ttl=900)
 
 # ==============================
 # ---- DB INIT / LOAD ----
 # ==============================
+INSERT_SQL = """
+INSERT INTO merit_data
+(University, Campus, Department, Program, Year, MinimumMerit, MaximumMerit)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+def parse_csv_row(row):
+    """Turns one CSV dict row into an INSERT tuple; None if the row is malformed."""
+    # tolerate slight header differences
+    uni  = row.get("University") or row.get("university") or ""
+    camp = row.get("Campus") or row.get("campus") or ""
+    dept = row.get("Department") or row.get("department") or ""
+    prog = row.get("Program") or row.get("program") or ""
+    year = row.get("Year") or row.get("year") or "0"
+    minm = row.get("Minimum Merit") or row.get("MinimumMerit") or row.get("minimum_merit") or "0"
+    maxm = row.get("Maximum Merit") or row.get("MaximumMerit") or row.get("maximum_merit") or "0"
+    try:
+        return (
+            uni.strip(), camp.strip(), dept.strip(), prog.strip(),
+            int(year), float(minm), float(maxm)
+        )
+    except (TypeError, ValueError):
+        # skip malformed rows
+        return None
+
+def csv_row_tuples(path):
+    """Yields parsed rows from the CSV, skipping malformed ones."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            t = parse_csv_row(row)
+            if t:
+                yield t
+
 def init_database():
     """Creates the table if it's missing and loads CSV if empty."""
     conn = sqlite3.connect(DB_FILE)
     cur = conn.cursor()
 
+    # bulk-load friendly settings; WAL sticks to the db file for later readers
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-200000")  # ~200 MB page cache
+
     cur.execute("""
     CREATE TABLE IF NOT EXISTS merit_data (
         University TEXT,
@@ -55,29 +137,9 @@ def init_database():
     cur.execute("SELECT COUNT(*) FROM merit_data")
     count = cur.fetchone()[0]
     if count == 0 and os.path.exists(CSV_FILE):
-        with open(CSV_FILE, newline="", encoding="utf-8") as fh:
-            csv_reader = csv.DictReader(fh)
-            for row in csv_reader:
-                # tolerate slight header differences
-                uni  = row.get("University") or row.get("university") or ""
-                camp = row.get("Campus") or row.get("campus") or ""
-                dept = row.get("Department") or row.get("department") or ""
-                prog = row.get("Program") or row.get("program") or ""
-                year = row.get("Year") or row.get("year") or "0"
-                minm = row.get("Minimum Merit") or row.get("MinimumMerit") or row.get("minimum_merit") or "0"
-                maxm = row.get("Maximum Merit") or row.get("MaximumMerit") or row.get("maximum_merit") or "0"
-                try:
-                    cur.execute("""
-                    INSERT INTO merit_data 
-                    (University, Campus, Department, Program, Year, MinimumMerit, MaximumMerit)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        uni.strip(), camp.strip(), dept.strip(), prog.strip(),
-                        int(year), float(minm), float(maxm)
-                    ))
-                except Exception:
-                    # skip malformed rows
-                    continue
+        # one transaction; executemany pulls rows straight from the generator
+        conn.execute("BEGIN")
+        cur.executemany(INSERT_SQL, csv_row_tuples(CSV_FILE))
         conn.commit()
     conn.close()
 
@@ -102,42 +164,110 @@ def grab_merit_data():
     conn.close()
     return records
 
+def load_csv_records(path):
+    """Parses the CSV straight into the same list of dicts grab_merit_data returns."""
+    records = []
+    for uni, camp, dept, prog, year, minm, maxm in csv_row_tuples(path):
+        records.append({
+            "University": uni,
+            "Campus": camp,
+            "Department": dept,
+            "Program": prog,
+            "Year": year,
+            "Minimum Merit": minm,
+            "Maximum Merit": maxm
+        })
+    return records
+
 # Boot DB & cache
-init_database()
-merit_records = grab_merit_data()
+# The DB is only kept for persistence; lookups run off the in-memory records,
+# so read them from the CSV directly and only touch SQLite on first boot
+# (or when there is no CSV to read from).
+if not os.path.exists(DB_FILE):
+    init_database()
+if os.path.exists(CSV_FILE):
+    merit_records = load_csv_records(CSV_FILE)
+else:
+    merit_records = grab_merit_data()
+# Intern the names: they repeat across hundreds of rows, so every row (and the
+# lowercased index keys below) shares one copy per distinct name. Boot data
+# only; query strings are not interned since they come from users.
+for rec in merit_records:
+    for field in ("University", "Campus", "Department", "Program"):
+        rec[field] = sys.intern(rec[field])
+# Read-only from here on: gunicorn preloads the app and workers share these
+# structures copy-on-write, so nothing below may mutate them after boot.
+merit_records = tuple(merit_records)
 
 # ==============================
 # ---- CACHED LOOKUPS ----
 # ==============================
-UNIS  = sorted({r["University"]  for r in merit_records if r["University"]})
-DEPTS = sorted({r["Department"]  for r in merit_records if r["Department"]})
-PROGS = sorted({r["Program"]     for r in merit_records if r["Program"]})
-CAMPS = sorted({r["Campus"]      for r in merit_records if r["Campus"]})
+UNIS  = tuple(sorted({r["University"]  for r in merit_records if r["University"]}))
+DEPTS = tuple(sorted({r["Department"]  for r in merit_records if r["Department"]}))
+PROGS = tuple(sorted({r["Program"]     for r in merit_records if r["Program"]}))
+CAMPS = tuple(sorted({r["Campus"]      for r in merit_records if r["Campus"]}))
+
+# Column-wise copies of merit_records (struct-of-arrays) so lookups only touch
+# the fields they filter on; *_L columns are pre-lowercased for comparisons.
+UNI_L    = tuple(sys.intern(r["University"].lower()) for r in merit_records)
+DEPT_L   = tuple(sys.intern(r["Department"].lower()) for r in merit_records)
+PROG_L   = tuple(sys.intern(r["Program"].lower())    for r in merit_records)
+CAMP_COL = tuple(r["Campus"]             for r in merit_records)
+DEPT_COL = tuple(r["Department"]         for r in merit_records)
+PROG_COL = tuple(r["Program"]            for r in merit_records)
+YEAR_COL = tuple(int(r["Year"])          for r in merit_records)
+
+# Lookups keyed on lowercased (uni, dept, prog) prefixes, so the helpers below
+# do a dict hit instead of scanning every record: row indexes per
+# (uni, dept, prog), plus the sorted answers the "what's available" helpers return.
+IDX_UDP      = defaultdict(list)
+DEPTS_BY_UNI = defaultdict(set)
+PROGS_BY_UD  = defaultdict(set)
+CAMPS_BY_UDP = defaultdict(set)
+for i, (u, d, p) in enumerate(zip(UNI_L, DEPT_L, PROG_L)):
+    IDX_UDP[(u, d, p)].append(i)
+    DEPTS_BY_UNI[u].add(DEPT_COL[i])
+    PROGS_BY_UD[(u, d)].add(PROG_COL[i])
+    CAMPS_BY_UDP[(u, d, p)].add(CAMP_COL[i])
+IDX_UDP      = {k: tuple(v) for k, v in IDX_UDP.items()}
+DEPTS_BY_UNI = {k: tuple(sorted(v)) for k, v in DEPTS_BY_UNI.items()}
+PROGS_BY_UD  = {k: tuple(sorted(v)) for k, v in PROGS_BY_UD.items()}
+CAMPS_BY_UDP = {k: tuple(sorted(v)) for k, v in CAMPS_BY_UDP.items()}
 
 # Map uni -> campuses
 UNI_TO_CAMP = {}
 for rec in merit_records:
     UNI_TO_CAMP.setdefault(rec["University"], set()).add(rec["Campus"])
 for k in UNI_TO_CAMP:
-    UNI_TO_CAMP[k] = sorted(UNI_TO_CAMP[k])
+    UNI_TO_CAMP[k] = tuple(sorted(UNI_TO_CAMP[k]))
 
 # ==============================
 # ---- NORMALIZATION / FUZZY ----
 # ==============================
-def ratio(a, b):
-    return difflib.SequenceMatcher(None, (a or "").lower(), (b or "").lower()).ratio()
+def best_match(candidate, options, options_l, cutoff):
+    """options_l is options lowercased, same order; candidate is already lowercased."""
+    # fuzz.ratio (normalized Indel similarity) tracks difflib's ratio closely, so the
+    # cutoffs below still mean the same thing; WRatio's partial matching would let
+    # e.g. Physics drift onto unrelated departments.
+    res = process.extractOne(candidate, options_l, scorer=fuzz.ratio, score_cutoff=cutoff * 100)
+    return options[res[2]] if res else None
+
+# The boot-time option tuples never change, so their ids are stable cache keys
+OPTION_SETS = {id(t): (t, tuple(o.lower() for o in t)) for t in (UNIS, DEPTS, PROGS, CAMPS)}
+
+@functools.lru_cache(maxsize=10000)
+def fuzzy_pick_cached(candidate, options_id, cutoff):
+    options, options_l = OPTION_SETS[options_id]
+    return best_match(candidate, options, options_l, cutoff)
 
 def fuzzy_pick(candidate, options, cutoff=0.80):
     """Safer fuzzy matching: only returns a value if >= cutoff."""
     if not candidate or not options:
         return None
-    best = None
-    best_r = 0.0
-    for o in options:
-        r = ratio(candidate, o)
-        if r > best_r:
-            best_r, best = r, o
-    return best if best_r >= cutoff else None
+    cand = candidate.strip().lower()
+    if id(options) in OPTION_SETS:
+        return fuzzy_pick_cached(cand, id(options), cutoff)
+    return best_match(cand, options, [o.lower() for o in options], cutoff)
 
 # Aliases — extended and safer (Physics will not map to Computing)
 dept_aliases = {
@@ -180,6 +310,17 @@ campus_aliases = {
     # add more as needed
 }
 
+# Precompiled patterns for the per-request paths
+LAST_YEAR_RE   = re.compile(r"\blast\s+year\b")
+YEAR_RE        = re.compile(r"\b(20\d{2}|19\d{2})\b")
+CAMP_SPLIT_RE  = re.compile(r"\s*(?:,|and|&)\s*", re.IGNORECASE)
+COMMA_SPLIT_RE = re.compile(r",\s*")
+MULTI_CAMP_RE  = re.compile(r"\band\b|\&", re.IGNORECASE)
+POLICY_RE      = re.compile(r"\b(vacant seats?|vacancies|merit\s*list(?:s)?|policy|how many lists?)\b")
+TOKEN_RE       = re.compile(r"[A-Za-z0-9']{3,}")
+SHORT_TOKEN_RE = re.compile(r"[A-Za-z0-9']{2,}")
+
+@functools.lru_cache(maxsize=4096)
 def norm_dept(txt):
     if not txt: return None
     t = txt.strip().lower()
@@ -193,6 +334,7 @@ def norm_dept(txt):
     fm = fuzzy_pick(txt, DEPTS, cutoff=0.83)
     return fm or txt.strip()
 
+@functools.lru_cache(maxsize=4096)
 def norm_prog(txt):
     if not txt: return None
     t = txt.strip().lower().replace("-", "").replace("_", "").replace(" ", "")
@@ -201,6 +343,7 @@ def norm_prog(txt):
     fm = fuzzy_pick(txt, PROGS, cutoff=0.90)  # program set is small; be strict
     return fm or txt.strip()
 
+@functools.lru_cache(maxsize=4096)
 def norm_uni(txt):
     if not txt: return None
     # exact
@@ -211,10 +354,11 @@ def norm_uni(txt):
     fm = fuzzy_pick(txt, UNIS, cutoff=0.78)
     return fm or txt.strip()
 
+@functools.lru_cache(maxsize=4096)
 def norm_campus(txt):
     if not txt: return ""
     # support comma, 'and'
-    parts = re.split(r"\s*(?:,|and|&)\s*", txt, flags=re.IGNORECASE)
+    parts = CAMP_SPLIT_RE.split(txt)
     normalized = []
     for p in parts:
         p_s = p.strip()
@@ -239,7 +383,7 @@ def campus_like(c1, c2):
     if not c2:
         return True
     c1_l = (c1 or "").lower()
-    c2_list = [x.strip().lower() for x in re.split(r',\s*', c2) if x.strip()]
+    c2_list = [x.strip().lower() for x in COMMA_SPLIT_RE.split(c2) if x.strip()]
     return any(part == c1_l or part in c1_l for part in c2_list)
 
 # ---------- NEW: uni-aware department adjustment ----------
@@ -261,23 +405,22 @@ def adjust_dept_for_uni(uni, dept):
 # ==============================
 # ---- DATA HELPERS ----
 # ==============================
+def lower_key(txt):
+    """Lowercased lookup key for the *_L-keyed indexes."""
+    return (txt or "").lower()
+
+def udp_rows(uni, dept, prog):
+    """Indexes of rows matching (uni, dept, prog)."""
+    return IDX_UDP.get((lower_key(uni), lower_key(dept), lower_key(prog)), ())
+
 def lookup_rows(uni, camp, dept, prog, yr):
-    hits = []
-    for rec in merit_records:
-        if rec["University"].lower() != (uni or "").lower(): continue
-        if not campus_like(rec["Campus"], camp): continue
-        if rec["Department"].lower() != (dept or "").lower(): continue
-        if rec["Program"].lower() != (prog or "").lower(): continue
-        if int(rec["Year"]) != int(yr): continue
-        hits.append(rec)
-    return hits
+    yr = int(yr)
+    return [merit_records[i] for i in udp_rows(uni, dept, prog)
+            if YEAR_COL[i] == yr and campus_like(CAMP_COL[i], camp)]
 
 def available_years(uni, dept, prog, camp=None):
-    ys = sorted({r["Year"] for r in merit_records
-                 if r["University"].lower()==(uni or "").lower()
-                 and r["Department"].lower()==(dept or "").lower()
-                 and r["Program"].lower()==(prog or "").lower()
-                 and (camp is None or campus_like(r["Campus"], camp))})
+    ys = sorted({YEAR_COL[i] for i in udp_rows(uni, dept, prog)
+                 if camp is None or campus_like(CAMP_COL[i], camp)})
     return ys
 
 def closest_year(uni, dept, prog, yr, camp=None):
@@ -287,20 +430,17 @@ def closest_year(uni, dept, prog, yr, camp=None):
 
 def campuses_offering(uni, dept, prog, yr=None):
     """Return campuses at uni that offer (dept, prog), optionally for specific year."""
-    camps = sorted({r["Campus"] for r in merit_records
-                    if r["University"].lower()==(uni or "").lower()
-                    and r["Department"].lower()==(dept or "").lower()
-                    and r["Program"].lower()==(prog or "").lower()
-                    and (yr is None or int(r["Year"])==int(yr))})
+    if yr is None:
+        return CAMPS_BY_UDP.get((lower_key(uni), lower_key(dept), lower_key(prog)), ())
+    camps = tuple(sorted({CAMP_COL[i] for i in udp_rows(uni, dept, prog)
+                          if YEAR_COL[i] == int(yr)}))
     return camps
 
 def departments_at_uni(uni):
-    return sorted({r["Department"] for r in merit_records if r["University"].lower()==(uni or "").lower()})
+    return DEPTS_BY_UNI.get(lower_key(uni), ())
 
 def programs_for(uni, dept):
-    return sorted({r["Program"] for r in merit_records
-                   if r["University"].lower()==(uni or "").lower()
-                   and r["Department"].lower()==(dept or "").lower()})
+    return PROGS_BY_UD.get((lower_key(uni), lower_key(dept)), ())
 
 # ==============================
 # ---- EXTRACTION / INTENT ----
@@ -309,72 +449,91 @@ def detect_year_from_text(msg):
     # "last year" support + explicit four-digit
     msg_l = (msg or "").lower()
     now_y = datetime.now().year
-    if re.search(r"\blast\s+year\b", msg_l):
+    if LAST_YEAR_RE.search(msg_l):
         return now_y - 1
-    m = re.search(r"\b(20\d{2}|19\d{2})\b", msg_l)
+    m = YEAR_RE.search(msg_l)
     if m:
         return int(m.group(1))
     return now_y  # default to current year
 
+def build_entity_automaton():
+    """
+    One Aho-Corasick automaton over every university/department/program/campus
+    name and alias. Each word maps to (kind, rank, canonical, whole_word) entries;
+    rank keeps the old scan priority (aliases first, then names, in dict/list order).
+    """
+    sources = [
+        ("uni",  [(u.lower(), u, False) for u in UNIS]),
+        ("dept", [(k, v, True) for k, v in dept_aliases.items()]),
+        ("dept", [(d.lower(), d, False) for d in DEPTS]),
+        ("prog", [(k, v, True) for k, v in prog_aliases.items()]),
+        ("prog", [(p.lower(), p, False) for p in PROGS]),
+        ("camp", [(k, v, True) for k, v in campus_aliases.items()]),
+        ("camp", [(c.lower(), c, False) for c in CAMPS]),
+    ]
+    entries = defaultdict(list)
+    ranks = defaultdict(int)
+    for kind, words in sources:
+        for word, canon, whole_word in words:
+            entries[word].append((kind, ranks[kind], canon, whole_word))
+            ranks[kind] += 1
+    automaton = ahocorasick.Automaton()
+    for word, vals in entries.items():
+        automaton.add_word(word, (len(word), tuple(vals)))
+    automaton.make_automaton()
+    return automaton
+
+ENTITY_AUTOMATON = build_entity_automaton()
+
+def is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+def scan_entities(msg_l):
+    """Single pass over msg_l; returns {kind: [(rank, canonical), ...]} for every hit."""
+    hits = defaultdict(list)
+    for end, (n, vals) in ENTITY_AUTOMATON.iter(msg_l):
+        start = end - n + 1
+        bounded = ((start == 0 or not is_word_char(msg_l[start - 1]))
+                   and (end + 1 == len(msg_l) or not is_word_char(msg_l[end + 1])))
+        for kind, rank, canon, whole_word in vals:
+            if bounded or not whole_word:
+                hits[kind].append((rank, canon))
+    return hits
+
 def cheap_extract(msg):
     """Extracts (uni, camp, dept, prog, year) with safer fuzzy & aliases."""
     msg_l = (msg or "").lower()
+    hits = scan_entities(msg_l)
 
     # university (substring, then fuzzy)
-    uni_found = None
-    for u in UNIS:
-        if u.lower() in msg_l:
-            uni_found = u; break
+    uni_found = min(hits["uni"])[1] if hits["uni"] else None
     if not uni_found:
-        tokens = re.findall(r"[A-Za-z0-9']{3,}", msg_l)
+        tokens = TOKEN_RE.findall(msg_l)
         for token in tokens:
             fm = fuzzy_pick(token, UNIS, cutoff=0.80)
             if fm: uni_found = fm; break
 
     # department (aliases, substrings, safe fuzzy)
-    dept_found = None
-    for k, v in dept_aliases.items():
-        if re.search(rf"\b{k}\b", msg_l):
-            dept_found = v; break
-    if not dept_found:
-        for d in DEPTS:
-            if d.lower() in msg_l:
-                dept_found = d; break
+    dept_found = min(hits["dept"])[1] if hits["dept"] else None
     if not dept_found:
-        for token in re.findall(r"[A-Za-z0-9']{2,}", msg_l):
+        for token in SHORT_TOKEN_RE.findall(msg_l):
             fm = fuzzy_pick(token, DEPTS, cutoff=0.83)
             if fm: dept_found = fm; break
 
-    # program (aliases, substrings, safe fuzzy)
-    prog_found = None
-    for k, v in prog_aliases.items():
-        if re.search(rf"\b{k}\b", msg_l):
-            prog_found = v; break
-    if not prog_found:
-        for p in PROGS:
-            if p.lower() in msg_l:
-                prog_found = p; break
+    # program (aliases, substrings)
+    prog_found = min(hits["prog"])[1] if hits["prog"] else None
     if not prog_found:
         # default to BS if user wrote "CS", "Physics" etc. without program
         prog_found = "BS"
 
     # campuses (short forms, known names; multi-campus via comma/and/&)
+    # if user wrote "... Islamabad and Lahore ..." every name is a separate hit
     camp_found = None
-    camps_detected = []
-    for short, full in campus_aliases.items():
-        if re.search(rf"\b{re.escape(short)}\b", msg_l):
-            camps_detected.append(full)
-    for c in CAMPS:
-        if c.lower() in msg_l:
-            camps_detected.append(c)
-    mc = re.split(r"\s*(?:,|and|&)\s*", msg_l)
-    # if user wrote "... Islamabad and Lahore ..."
-    # the earlier detection already captured texts
-    if camps_detected:
-        # dedupe in order
+    if hits["camp"]:
+        # dedupe in priority order
         seen = set()
         ordered = []
-        for x in camps_detected:
+        for _, x in sorted(set(hits["camp"])):
             if x.lower() not in seen:
                 seen.add(x.lower()); ordered.append(x)
         camp_found = ", ".join(ordered)
@@ -387,7 +546,7 @@ def cheap_extract(msg):
 def is_policy_question(msg):
     msg_l = (msg or "").lower()
     # Expanded policy detection (avoid confusing with "merit score")
-    if re.search(r"\b(vacant seats?|vacancies|merit\s*list(?:s)?|policy|how many lists?)\b", msg_l):
+    if POLICY_RE.search(msg_l):
         return True
     return False
 
@@ -399,7 +558,7 @@ def build_merit_line(r):
 
 def reply_for_multi_campus(uni, dept, prog, camp, yr):
     # camp may already be "A, B, C"
-    camp_list = [c.strip() for c in re.split(r',\s*', camp) if c.strip()]
+    camp_list = [c.strip() for c in COMMA_SPLIT_RE.split(camp) if c.strip()]
     replies = []
     for c in camp_list:
         rows = lookup_rows(uni, c, dept, prog, yr)
@@ -467,18 +626,42 @@ def reply_for_single_or_uncamped(uni, dept, prog, camp, yr):
         return f"No match found. {uni} campuses: {', '.join(UNI_TO_CAMP[uni])}. Departments: {', '.join(deps)}"
     return "Sorry, nothing matched."
 
+# ==============================
+# ---- LLM EXTRACTION ----
+# ==============================
+# Parsed Gemini output keyed on the lowercased/trimmed message
+LLM_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+
+async def llm_extract(user_msg):
+    """Asks Gemini for the query fields; returns the parsed dict."""
+    prompt = f"""
+    From the question, pull:
+    - university (one of: {UNIS})
+    - campus (string; "" if none; support multi-campus via comma or 'and')
+    - department (canonical to: {DEPTS})
+    - program (canonical to: {PROGS}, default "BS")
+    - year (int, default current year; 'last year' = current year-1)
+
+    Return ONLY JSON with keys: university, campus, department, program, year.
+    User said:
+    \"\"\"{user_msg}\"\"\""""
+    res = await llm_model.generate_content_async(prompt)
+    return orjson.loads(res.text)
+
 # ==============================
 # ---- CHAT ENDPOINT ----
 # ==============================
 @app.route("/chat", methods=["POST"])
-def chat():
-    payload = request.json or {}
-    user_msg = payload.get("message", "")
+async def chat():
+    # non-JSON bodies are rejected up front, as Flask's request.json did
+    if not request.is_json:
+        abort(415)
+    payload = await request.get_json() or {}
+    user_msg = payload.get("message") or ""
     session_id = payload.get("session") or payload.get("session_id") or request.remote_addr or "default"
 
     # load/ensure context
-    with ctx_lock:
-        ctx = user_context.get(session_id, {})
+    ctx = user_context.get(session_id, {})
 
     # 1) Merit-list policy questions (handle first)
     if is_policy_question(user_msg):
@@ -487,41 +670,27 @@ def chat():
                                   "Typically, universities issue 2–3 merit lists and may extend if seats remain vacant. "
                                   "For a specific campus, ask e.g. 'Vacant-seats policy at FAST Islamabad'.")})
 
-    # 2) Try LLM extraction
-    uni, camp, dept, prog, yr = None, None, None, None, None
-    try:
-        prompt = f"""
-        From the question, pull:
-        - university (one of: {UNIS})
-        - campus (string; "" if none; support multi-campus via comma or 'and')
-        - department (canonical to: {DEPTS})
-        - program (canonical to: {PROGS}, default "BS")
-        - year (int, default current year; 'last year' = current year-1)
-
-        Return ONLY JSON with keys: university, campus, department, program, year.
-        User said:
-        \"\"\"{user_msg}\"\"\""""
-        res = llm_model.generate_content(prompt)
-        text_out = (res.text or "").strip()
-        json_match = re.search(r"\{.*\}", text_out, re.DOTALL)
-        info = json.loads(json_match.group()) if json_match else None
-        if info:
-            uni = info.get("university")
-            camp = info.get("campus", "")
-            dept = info.get("department")
-            prog = info.get("program", "BS")
-            yr = int(info.get("year", detect_year_from_text(user_msg)))
-    except Exception:
-        info = None
-
-    # 3) Fallback extractor if LLM didn’t give all fields
-    if not (uni and dept and prog and yr):
-        f_uni, f_camp, f_dep, f_prog, f_yr = cheap_extract(user_msg)
-        uni = uni or f_uni
-        camp = camp or f_camp
-        dept = dept or f_dep
-        prog = prog or f_prog
-        yr = yr or f_yr
+    # 2) Local extraction first; it is cheap and usually resolves the query
+    uni, camp, dept, prog, yr = cheap_extract(user_msg)
+
+    # 3) LLM fallback only if a required field is still missing
+    #    (repeated phrasings are served from LLM_CACHE)
+    if user_msg.strip() and not (uni and dept and prog and yr):
+        try:
+            cache_key = user_msg.strip().lower()
+            info = LLM_CACHE.get(cache_key)
+            if info is None:
+                info = await llm_extract(user_msg)
+                if info:
+                    LLM_CACHE[cache_key] = info
+            if info:
+                uni = info.get("university") or uni
+                camp = info.get("campus") or camp
+                dept = info.get("department") or dept
+                prog = info.get("program") or prog
+                yr = int(info.get("year") or yr)
+        except Exception:
+            info = None
 
     # 4) Normalize with safe fuzzy & aliases
     uni = norm_uni(uni) if uni else None
@@ -544,15 +713,14 @@ def chat():
     if missing:
         # store what we already know; ask only the next missing piece
         ask_next = missing[0]
-        with ctx_lock:
-            user_context[session_id] = {
-                "awaiting": ask_next,
-                "known_university": uni,
-                "known_department": dept,
-                "known_program": prog,
-                "known_campus": camp,
-                "known_year": yr
-            }
+        user_context[session_id] = {
+            "awaiting": ask_next,
+            "known_university": uni,
+            "known_department": dept,
+            "known_program": prog,
+            "known_campus": camp,
+            "known_year": yr
+        }
         if ask_next == "university":
             return jsonify({"reply": f"Which university? For example: {', '.join(UNIS[:8])}."})
         if ask_next == "department":
@@ -578,11 +746,10 @@ def chat():
             prog_try = norm_prog(user_msg)
             if prog_try: prog = prog_try
         # Once anything is filled, clear awaiting
-        with ctx_lock:
-            user_context.pop(session_id, None)
+        user_context.pop(session_id, None)
 
     # 6) Multi-campus support
-    if camp and ("," in camp or re.search(r"\band\b|\&", camp, flags=re.IGNORECASE)):
+    if camp and ("," in camp or MULTI_CAMP_RE.search(camp)):
         reply = reply_for_multi_campus(uni, dept, prog, camp, yr)
         return jsonify({"reply": reply})
 
@@ -594,16 +761,27 @@ def chat():
 # ---- BASIC ROUTES ----
 # ==============================
 @app.route("/")
-def home():
-    return app.send_static_file("index.html")
+async def home():
+    return await app.send_static_file("index.html")
 
 @app.route("/health")
-def health():
+async def health():
     return jsonify({"ok": True})
 
 # ==============================
 # ---- MAIN ----
 # ==============================
 if __name__ == "__main__":
-    # run in debug for development; disable in production
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    if os.getenv("APP_ENV") == "dev":
+        # debug server + reloader, development only
+        app.run(debug=True, host="0.0.0.0", port=5000)
+    else:
+        # single-process production server that also runs on Windows; multi-worker
+        # deployments go through the Procfile (gunicorn.conf.py) instead
+        import asyncio
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+
+        config = Config()
+        config.bind = [f"0.0.0.0:{os.getenv('PORT', '5000')}"]
+        asyncio.run(serve(app, config))
@@ -0,0 +1,19 @@
+# gunicorn settings for production (used by the Procfile)
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# one asyncio event loop per process; processes sidestep the GIL for CPU work
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Load app.py (CSV, lookup tables, indexes) once in the master; workers then
+# share those pages copy-on-write instead of each building their own copy.
+preload_app = True
+
+def pre_fork(server, worker):
+    # move boot-time objects out of the GC's tracked generations so collections
+    # in the workers don't write to (and un-share) those pages
+    gc.freeze()